@@ -8,4 +8,12 @@ TYPE_NUM = 'NUMERIC'
 TYPE_STR = 'STRING'
 TYPE_UNSUPPORTED = 'UNSUPPORTED'
 
+# geometry names indexed by shapely type id
+GEOM_TYPES = [
+    'Point', 'LineString', 'LinearRing', 'Polygon',
+    'MultiPoint', 'MultiLineString', 'MultiPolygon', 'GeometryCollection'
+]
+
 NULLS = [None, np.nan, 'null', '']
+
+PERCENTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
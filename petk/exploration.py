@@ -1,3 +1,9 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import os
+
 import geopandas as gpd
 import numpy as np
 import pandas as pd
@@ -7,111 +13,194 @@ import petk.constants as constants
 import petk.tools as tools
 import petk.validation as validation
 
+# None and NaN are missing already, only the remaining markers have to be searched for
+NULLS = frozenset(x for x in constants.NULLS if not pd.isnull(x))
+VALIDATORS = {
+    method: getattr(validation, method) for method in dir(validation) if callable(getattr(validation, method))
+}
+
 
 class DataReport:
     # TODO: clear validation cache on schema change
 
     def __init__(self, data, schema={}):
-        self.df = data.copy()
-        self.df.index.name = 'index'
+        if not isinstance(data, pd.DataFrame) and hasattr(data, 'collect'):
+            # eg. polars LazyFrame
+            data = data.collect()
+
+        owned = False
+        if not isinstance(data, pd.DataFrame) and hasattr(data, 'to_pandas'):
+            # eg. polars DataFrame, pyarrow Table; conversion already yields a new frame
+            data = data.to_pandas()
+            owned = True
 
         self.schema = schema
         for col, dd in self.schema.items():
-            assert col in self.df.columns, 'Invalid input schema, column {0} does not exist in data'.format(col)
+            assert col in data.columns, 'Invalid input schema, column {0} does not exist in data'.format(col)
 
             for k, v in dd.items():
                 if k in ['nulls']:
                     if not isinstance(v, (list, tuple)):
                         self.schema[col][k] = [v]
 
-        for col in self.df.columns:
+        # columns sharing the same null markers are searched together, most share constants.NULLS only
+        # columns are kept by position throughout, duplicated labels can not be reindexed
+        groups = {}
+        for i, col in enumerate(data.columns):
             extra = self.schema[col]['nulls'] if tools.key_exists(self.schema, col, 'nulls') else []
-            self.df[col] = self.df[col].replace(constants.NULLS + extra, np.nan)
+            groups.setdefault(tuple(x for x in extra if not pd.isnull(x)), []).append(i)
+
+        dtypes = data.dtypes.to_numpy()
+
+        hits = []
+        for extra, positions in groups.items():
+            nulls = NULLS.union(extra) if extra else NULLS
+
+            # text markers can not occur in numeric, boolean or date columns
+            typed = [i for i in positions if tools.get_dtype_type(dtypes[i]) is not None]
+            untyped = [i for i in positions if i not in typed]
+
+            for subset, markers in [(typed, [x for x in nulls if not isinstance(x, str)]), (untyped, nulls)]:
+                if subset and markers:
+                    found = data.iloc[:, subset].isin(markers).to_numpy()
+                    hits.extend((i, found[:, j]) for j, i in enumerate(subset) if found[:, j].any())
+
+        # the frame is only ever written to when markers are found, otherwise share the caller's data
+        if not hits:
+            self.df = data if owned else data.copy(deep=False)
+        else:
+            self.df = data if owned else data.copy()
+
+            for i, found in hits:
+                column = self.df.iloc[:, i].mask(found)
+
+                # isetitem swaps the column in by position, older pandas upcasts through iloc instead
+                if hasattr(self.df, 'isetitem'):
+                    self.df.isetitem(i, column)
+                else:
+                    self.df.iloc[:, i] = column
+
+        self.df.index = self.df.index.rename('index')
 
-        self.description = pd.DataFrame()
         self.validation = pd.DataFrame()
 
-    def introduce(self, as_dict=False):
-        base = pd.Series({
-            ('basic', 'memory_usage'): np.sum(self.df.memory_usage(deep=True)),
+        self._col_types = {}
+        self._descriptions = {}
+        self._minimal = set()
+        self._memory = {}
+        self._counts = None
+        self._validated = set()
+
+    def introduce(self, as_dict=False, deep=False):
+        results = {
+            ('basic', 'memory_usage'): self._memory_usage(deep=deep),
             ('basic', 'rows'): len(self.df),
             ('basic', 'columns'): len(self.df.columns),
-            ('observations', 'total'): np.prod(self.df.shape),
-            ('observations', 'missing'): np.sum(len(self.df) - self.df.count())
-        })
+            ('observations', 'total'): self.df.size,
+            ('observations', 'missing'): self.df.size - self._non_null_counts().sum()
+        }
 
-        additions = []
+        self._infer_types()
 
-        additions.append(
-            pd.Series([
-                ('columns', '{0}'.format(tools.get_type(self.df[col]).lower())) for col in self.df.columns
-            ]).value_counts()
-        )
+        type_counts = Counter(self._col_types[col].lower() for col in self.df.columns)
+        results.update({('columns', k): v for k, v in type_counts.most_common()})
 
         if isinstance(self.df, gpd.GeoDataFrame):
-            centroid_loc = tools.get_point_location(self.df.centroid)
-            has_z = self.df.has_z.value_counts()
-
-            additions.append(
-                pd.Series({
-                    ('geospatial', 'crs'): self.df.crs['init'],
-                    ('geospatial', 'centroid_location'): centroid_loc,
-                    ('geospatial', 'bounds'): self.df.total_bounds,
-                    ('geospatial', '3d_shapes'): has_z[True] if True in has_z.index else 0
-                })
-            )
+            summary = tools.get_geometry_summary(self.df.geometry)
+
+            results.update({
+                ('geospatial', 'crs'): self.df.crs['init'],
+                ('geospatial', 'centroid_location'): tools.get_point_location(summary['centroids']),
+                ('geospatial', 'bounds'): summary['bounds'],
+                ('geospatial', '3d_shapes'): summary['has_z']
+            })
+
+            results.update({
+                ('geospatial', '{0}s'.format(k.lower())): v for k, v in summary['geom_types'].items()
+            })
 
-            geom_types = self.df.geom_type.value_counts()
-            geom_types.index = [('geospatial', '{0}s'.format(x.lower())) for x in geom_types.index]
-            additions.append(geom_types)
+        return self._format_results(pd.Series(results).to_frame(name='values'), as_dict=as_dict)
 
-        return self._format_results(base.append(additions).to_frame(name='values'), as_dict=as_dict)
+    @property
+    def sindex(self):
+        assert isinstance(self.df, gpd.GeoDataFrame), 'A spatial index requires geospatial data'
 
-    def describe(self, columns=[], as_dict=False):
+        # geopandas keeps the tree on the geometry array, later checks on the same column reuse it
+        return self.df.sindex
+
+    def describe(self, columns=[], as_dict=False, n_jobs=1, minimal=False):
         columns = self._find_columns(columns)
 
-        for c in columns:
-            if c not in self.description.columns:
-                self.description = pd.concat([ self.description, tools.get_description(self.df[c], name=c) ], axis=1, sort=False)
+        pending = [
+            c for c in columns if c not in self._descriptions or (c in self._minimal and not minimal)
+        ]
+
+        self._infer_types(pending)
+        counts = self._non_null_counts()
 
-        return self._format_results(self.description[columns], as_dict=as_dict)
+        args = (
+            [self._column(c) for c in pending],
+            pending,
+            [self._col_types[c] for c in pending],
+            [counts[c] for c in pending]
+        )
+
+        described = self._map(partial(tools.get_description, minimal=minimal), *args, n_jobs=n_jobs)
+
+        self._descriptions.update(zip(pending, described))
+
+        # only descriptions cut short by minimal need computing again for a full describe
+        shortened = [
+            c for c, description in zip(pending, described) if minimal and
+            self._col_types[c] in [constants.TYPE_BOOL, constants.TYPE_DATE, constants.TYPE_NUM] and
+            description['distinct_count'] in [1, len(self.df)]
+        ]
+
+        self._minimal.difference_update(pending)
+        self._minimal.update(shortened)
+
+        return self._format_results(
+            pd.concat([self._descriptions[c] for c in columns], axis=1, sort=False), as_dict=as_dict
+        )
 
     # TODO: consider return passed when all results are valid
-    def validate(self, columns=[], as_dict=False, verbose=False):
+    def validate(self, columns=[], as_dict=False, verbose=False, n_jobs=1):
         columns = self._find_columns(columns)
 
-        for col, conditions in self.schema.items():
-            if col not in columns or \
-                ('column' in self.validation.columns and col in self.validation['column'].values):
-                continue
+        targets = set(columns) & self.schema.keys()
 
-            checks = np.intersect1d(
-                list(conditions.keys()),
-                [method for method in dir(validation) if callable(getattr(validation, method))]
-            )
+        pending = targets - self._validated
 
-            audits = {}
+        # columns are grouped by check, so each check runs over all of its columns in turn
+        checks = {}
+        for col in [c for c in columns if c in pending]:
+            for v in sorted(self.schema[col].keys() & VALIDATORS.keys()):
+                checks.setdefault(v, []).append(col)
 
-            if col == 'geometry':
-                issues = validation.geospatial(self.df[col])
+        # range checks are evaluated for every column at once
+        outbounds = tools.get_outbounds(self.df, {col: self.schema[col]['range'] for col in checks.get('range', [])})
 
-                if issues is not None:
-                    audits['geospatial'] = issues
+        issues = {(col, 'range'): outbounds.get(col) for col in checks.pop('range', [])}
 
-            for v in checks:
-                issues = getattr(validation, v)(self.df[col], conditions[v])
+        calls = {}
+        if 'geometry' in pending:
+            calls['geometry', 'geospatial'] = partial(validation.geospatial, self._column('geometry'))
 
-                if issues is not None:
-                    audits[v] = issues
+        for v, cols in checks.items():
+            for col in cols:
+                calls[col, v] = partial(VALIDATORS[v], self._column(col), self.schema[col][v])
 
-            if audits:
-                audits = pd.concat(audits.values(), keys=audits.keys()).to_frame().reset_index()
-                audits.columns = ['function', 'index', 'notes']
-                audits['column'] = col
-            else:
-                audits = pd.DataFrame()
+        issues.update(zip(calls.keys(), self._map(lambda call: call(), calls.values(), n_jobs=n_jobs)))
+        issues = {k: v for k, v in issues.items() if v is not None}
 
-            self.validation = pd.concat([self.validation, audits])
+        if issues:
+            audits = pd.concat(issues.values(), keys=issues.keys(), names=['column', 'function', 'index'])
+
+            self.validation = pd.concat(
+                [self.validation, audits.to_frame(name='notes').reset_index()], ignore_index=True
+            )
+
+        self._validated.update(pending)
 
         results = self.validation.copy()
         if not self.validation.empty:
@@ -125,6 +214,10 @@ class DataReport:
 
         return self._format_results(results, as_dict=as_dict, verbose=verbose)
 
+    def _column(self, col):
+        # positional access builds the Series straight from the block, without filling pandas' item cache
+        return self.df.iloc[:, self.df.columns.get_loc(col)]
+
     def _find_columns(self, columns):
         if not columns:
             columns = self.df.columns
@@ -136,28 +229,84 @@ class DataReport:
 
         return columns
 
+    def _infer_types(self, columns=None):
+        targets = self.df.columns if columns is None else set(columns)
+
+        if all(col in self._col_types for col in targets):
+            return
+
+        # types follow from the dtype alone for most columns, only all-null columns need the counts
+        counts = self._non_null_counts().to_numpy()
+        dtype_types = {}
+
+        # walked by position, a duplicated label selects several columns at once
+        columns = self.df.columns
+        for col, dtype, count, duplicated in zip(columns, self.df.dtypes, counts, columns.duplicated(keep=False)):
+            if col in self._col_types or col not in targets:
+                continue
+
+            if dtype not in dtype_types:
+                dtype_types[dtype] = tools.get_dtype_type(dtype)
+
+            if duplicated or dtype_types[dtype] is None:
+                self._type_of(col)
+            elif count == 0 and len(self.df):
+                self._col_types[col] = constants.TYPE_EMPTY
+            else:
+                self._col_types[col] = dtype_types[dtype]
+
+    def _memory_usage(self, deep=False):
+        if deep not in self._memory:
+            self._memory[deep] = tools.get_memory_usage(self.df, deep=deep)
+
+        return self._memory[deep]
+
+    def _map(self, func, *iterables, n_jobs=1):
+        # negative values count back from the number of cores, -1 uses all of them
+        if n_jobs < 0:
+            n_jobs = max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+
+        # columns are independent and the heavy work releases the GIL, threads avoid copying the data
+        if n_jobs > 1 and len(iterables[0]) > 1:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                return list(executor.map(func, *iterables))
+
+        return list(map(func, *iterables))
+
+    def _non_null_counts(self):
+        if self._counts is None:
+            self._counts = self.df.count()
+
+        return self._counts
+
+    def _type_of(self, col):
+        dtype = self._col_types.get(col)
+
+        if dtype is None:
+            dtype = self._col_types[col] = tools.get_type(self._column(col))
+
+        return dtype
+
     def _format_results(self, results, as_dict=False, verbose=False):
         if not results.empty and verbose:
             results = results.join(self.df)
 
         if as_dict:
             records = {}
+            leaf = results.columns[0] if len(results.columns) == 1 else None
 
-            for idx, row in results.iterrows():
+            # records are paired with the index, to_dict(orient='index') refuses duplicated labels
+            for idx, row in zip(results.index, results.to_dict(orient='records')):
                 key = idx
                 values = records
 
-                if not isinstance(idx, str):
-                    for k in idx:
-                        if not tools.key_exists(values, k):
-                            values[k] = {}
-
-                        if k != idx[-1]:
-                            values = values[k]
+                if isinstance(idx, tuple):
+                    for k in idx[:-1]:
+                        values = values.setdefault(k, {})
 
                     key = idx[-1]
 
-                values[key] = row.to_dict() if row.size > 1 else row.values[0]
+                values[key] = row if leaf is None else row[leaf]
 
             return records
 
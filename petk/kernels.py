@@ -0,0 +1,86 @@
+from numba import njit
+
+import numpy as np
+
+
+@njit(cache=True)
+def moments(values):
+    # single pass over finite values, central moments are sums of powers of the deviations
+    n = 0
+    mean = 0.0
+    m2 = 0.0
+    m3 = 0.0
+    m4 = 0.0
+    total = 0.0
+    minimum = np.inf
+    maximum = -np.inf
+
+    for x in values:
+        n += 1
+        delta = x - mean
+        delta_n = delta / n
+        delta_n2 = delta_n * delta_n
+        term = delta * delta_n * (n - 1)
+
+        mean += delta_n
+        m4 += term * delta_n2 * (n * n - 3 * n + 3) + 6 * delta_n2 * m2 - 4 * delta_n * m3
+        m3 += term * delta_n * (n - 2) - 3 * delta_n * m2
+        m2 += term
+
+        total += x
+        if x < minimum:
+            minimum = x
+        if x > maximum:
+            maximum = x
+
+    # mean absolute deviation needs the final mean, hence a second pass
+    deviations = 0.0
+    for x in values:
+        deviations += abs(x - mean)
+
+    return mean, m2, m3, m4, total, minimum, maximum, deviations / n
+
+@njit(cache=True)
+def tally(values):
+    n_inf = 0
+    n_zeros = 0
+
+    for x in values:
+        if x == 0.0:
+            n_zeros += 1
+        elif np.isinf(x):
+            n_inf += 1
+
+    return n_inf, n_zeros
+
+@njit(cache=True)
+def polygon_areas(coords, ring_offsets, polygon_offsets):
+    areas = np.zeros(polygon_offsets.size - 1)
+
+    for p in range(areas.size):
+        for r in range(polygon_offsets[p], polygon_offsets[p + 1]):
+            start, end = ring_offsets[r], ring_offsets[r + 1]
+
+            # shoelace relative to the first vertex, large projected coordinates otherwise lose precision
+            x0, y0 = coords[start, 0], coords[start, 1]
+            twice = 0.0
+            for i in range(start, end - 1):
+                twice += (coords[i, 0] - x0) * (coords[i + 1, 1] - y0) - (coords[i + 1, 0] - x0) * (coords[i, 1] - y0)
+
+            # the first ring is the shell, the remaining ones are holes
+            if r == polygon_offsets[p]:
+                areas[p] += abs(twice) / 2
+            else:
+                areas[p] -= abs(twice) / 2
+
+    return areas
+
+@njit(cache=True)
+def line_lengths(coords, offsets):
+    lengths = np.zeros(offsets.size - 1)
+
+    for l in range(lengths.size):
+        for i in range(offsets[l], offsets[l + 1] - 1):
+            lengths[l] += np.hypot(coords[i + 1, 0] - coords[i, 0], coords[i + 1, 1] - coords[i, 1])
+
+    return lengths
@@ -1,6 +1,9 @@
+from functools import lru_cache
+from pyproj import CRS
 from shapely.geometry import mapping, MultiPoint
 
 import importlib
+import shapely
 
 import numpy as np
 import pandas as pd
@@ -10,64 +13,226 @@ import pandas.api.types as pd_types
 
 import petk.constants as constants
 
+# shapely>=2.0 exposes vectorized functions over arrays of geometries
+SHAPELY_VECTORIZED = hasattr(shapely, 'get_type_id')
 
-def get_description(series, name=''):
-    count = count = series.count() # ONLY non-NaN observations
-    dtype = get_type(series)
+
+@lru_cache(maxsize=32)
+def get_crs(epsg):
+    return CRS.from_epsg(int(epsg))
+
+@lru_cache(maxsize=None)
+def get_kernels():
+    # numba is only imported on first use, an installed numba can still fail to import when it lags behind numpy
+    try:
+        import petk.kernels as kernels
+    except ImportError:
+        return None
+
+    return kernels
+
+def get_description(series, name='', dtype=None, count=None, minimal=False):
+    size = series.size
+    count = series.count() if count is None else count # ONLY non-NaN observations
+    dtype = dtype or get_type(series)
 
     description = {
         'content_type': dtype,
         'memory_usage': series.memory_usage(),
         'count': count,
-        'p_null': (series.size - count) / series.size,
-        'n_null': series.size - count,
+        'p_null': (size - count) / size,
+        'n_null': size - count,
     }
 
     # TODO: if GEO calculate other things
     if not dtype in [constants.TYPE_UNSUPPORTED, constants.TYPE_GEO]:
-        n_distinct = series.nunique()
+        n_distinct = get_distinct_count(series)
 
         description.update({
             'distinct_count': n_distinct,
             'is_constant': n_distinct == 1,
-            'is_unique': n_distinct == series.size,
-            'p_unique': n_distinct * 1.0 / series.size
+            'is_unique': n_distinct == size,
+            'p_unique': n_distinct * 1.0 / size
         })
 
+        # constant and id-like columns carry little distributional information
+        if minimal and n_distinct in [1, size]:
+            return pd.Series(description, name=name)
+
         if dtype == constants.TYPE_BOOL:
             description.update({
                 'mean': series.mean()
             })
-        elif dtype in [constants.TYPE_DATE, constants.TYPE_NUM]:
+        elif dtype == constants.TYPE_DATE:
             description.update({
                 'min': series.min(),
                 'max': series.max()
             })
 
-            for perc in [0.05, 0.25, 0.5, 0.75, 0.95]:
-                description['{:.0%}'.format(perc)] = series.quantile(perc)
+            for perc, value in series.quantile(constants.PERCENTILES).items():
+                description['{:.0%}'.format(perc)] = value
+        elif dtype == constants.TYPE_NUM:
+            values = series.to_numpy(dtype=float, na_value=np.nan)
+
+            kernels = get_kernels()
+
+            if kernels is not None:
+                n_inf, n_zeros = kernels.tally(values)
+            else:
+                n_zeros = np.count_nonzero(values == 0)
+                n_inf = np.count_nonzero(np.isinf(values))
 
-            if dtype == constants.TYPE_NUM:
-                n_zeros = series.size - np.count_nonzero(series)
-                n_inf = series.loc[(~np.isfinite(series)) & series.notnull()].size
+            description.update(get_numeric_stats(values))
 
+            # floats lose precision beyond 2**53, integer extremes and sums come from the integers themselves
+            if pd_types.is_integer_dtype(series.dtype) and count:
                 description.update({
-                    'mean': series.mean(),
-                    'std': series.std(),
-                    'variance': series.var(),
-                    'iqr': series.quantile(0.75) - series.quantile(0.25),
-                    'kurtosis': series.kurt(),
-                    'skewness': series.skew(),
-                    'sum': series.sum(),
-                    'mad': series.mad(),
-                    'cv': series.std() / series.mean(),
-                    'p_infinite': n_inf / series.size,
-                    'n_infinite': n_inf,
-                    'n_zeros': n_zeros,
-                    'p_zeros': n_zeros / series.size
+                    'min': series.min(),
+                    'max': series.max(),
+                    'sum': series.sum()
                 })
 
-    return pd.Series(description, name=name).to_frame()
+            description.update({
+                'p_infinite': n_inf / size,
+                'n_infinite': n_inf,
+                'n_zeros': n_zeros,
+                'p_zeros': n_zeros / size
+            })
+
+    return pd.Series(description, name=name)
+
+def get_distinct_count(series):
+    uniques = series.unique()
+
+    # object columns may keep both None and NaN after unique()
+    return len(uniques) - np.count_nonzero(pd.isnull(uniques))
+
+def get_dtype_type(dtype):
+    if pd_types.is_bool_dtype(dtype):
+        return constants.TYPE_BOOL
+    elif pd_types.is_datetime64_dtype(dtype):
+        return constants.TYPE_DATE
+    elif pd_types.is_numeric_dtype(dtype):
+        return constants.TYPE_NUM
+
+    # values have to be inspected, eg. object or geometry columns
+    return None
+
+def get_geometry_summary(series):
+    if SHAPELY_VECTORIZED:
+        geoms = np.asarray(series.values)
+        type_ids = shapely.get_type_id(geoms)
+        type_counts = np.bincount(type_ids[type_ids >= 0], minlength=len(constants.GEOM_TYPES))
+
+        return {
+            'centroids': shapely.centroid(geoms),
+            'bounds': shapely.total_bounds(geoms),
+            'has_z': np.count_nonzero(shapely.has_z(geoms)),
+            'geom_types': {constants.GEOM_TYPES[i]: n for i, n in enumerate(type_counts) if n}
+        }
+
+    return {
+        'centroids': series.centroid,
+        'bounds': series.total_bounds,
+        'has_z': np.count_nonzero(series.has_z),
+        'geom_types': series.geom_type.value_counts().to_dict()
+    }
+
+def get_memory_usage(df, sample_size=1000, deep=False):
+    # exact size walks every python object in object columns
+    if deep:
+        return int(df.memory_usage(deep=True).sum())
+
+    # positional, 'Index' comes first and column labels may repeat
+    usage = df.memory_usage(deep=False).to_numpy(dtype=float)
+    objects = [i for i, dtype in enumerate(df.dtypes) if dtype == object]
+
+    # deep inspection walks every python object, estimate it from a sample on large frames
+    if len(df) > sample_size:
+        rows = np.random.RandomState(0).choice(len(df), sample_size, replace=False)
+        scale = len(df) / sample_size
+    else:
+        rows, scale = np.arange(len(df)), 1
+
+    if objects:
+        sample = df.iloc[rows, objects]
+        usage[[i + 1 for i in objects]] = sample.memory_usage(deep=True, index=False).to_numpy() * scale
+
+    # an object index holds python objects just the same
+    if df.index.dtype == object:
+        usage[0] = df.index[rows].memory_usage(deep=True) * scale
+
+    return int(usage.sum())
+
+def get_numeric_stats(values):
+    # statistics over the finite values, infinites are reported separately
+    finite = values[np.isfinite(values)]
+    n = finite.size
+
+    if not n:
+        return {}
+
+    kernels = get_kernels()
+
+    if kernels is not None:
+        mean, m2, m3, m4, total, minimum, maximum, mad = kernels.moments(finite)
+    else:
+        mean = finite.mean()
+        deviations = finite - mean
+        squares = deviations * deviations
+        m2 = squares.sum()
+        m3 = (squares * deviations).sum()
+        m4 = (squares * squares).sum()
+
+        total, minimum, maximum = finite.sum(), finite.min(), finite.max()
+        mad = np.abs(deviations).mean()
+
+    # rounding leaves tiny moments on constant values, judged against the scale of the values themselves
+    constant = m2 <= np.finfo(float).eps * mean ** 2 * n
+
+    # finite is a private copy at this point, let the partial sort reuse it
+    quantiles = np.quantile(finite, constants.PERCENTILES, overwrite_input=True)
+
+    variance = m2 / (n - 1) if n > 1 else np.nan
+    std = np.sqrt(variance)
+
+    # bias corrected as in pandas' Series.skew and Series.kurt
+    if n < 3:
+        skewness = np.nan
+    elif constant:
+        skewness = 0.0
+    else:
+        skewness = n * (n - 1) ** 0.5 / (n - 2) * m3 / m2 ** 1.5
+
+    if n < 4:
+        kurtosis = np.nan
+    elif constant:
+        kurtosis = 0.0
+    else:
+        adjustment = 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+        kurtosis = n * (n + 1) * (n - 1) * m4 / ((n - 2) * (n - 3) * m2 ** 2) - adjustment
+
+    stats = {
+        'min': minimum,
+        'max': maximum
+    }
+
+    for perc, value in zip(constants.PERCENTILES, quantiles):
+        stats['{:.0%}'.format(perc)] = value
+
+    stats.update({
+        'mean': mean,
+        'std': std,
+        'variance': variance,
+        'iqr': quantiles[3] - quantiles[1],
+        'kurtosis': kurtosis,
+        'skewness': skewness,
+        'sum': total,
+        'mad': mad,
+        'cv': std / mean if mean else np.nan
+    })
+
+    return stats
 
 def get_point_location(points, provider='nominatim', user_agent='petk'):
     centroid = MultiPoint(points).centroid
@@ -79,35 +244,86 @@ def get_point_location(points, provider='nominatim', user_agent='petk'):
     else:
         return ', '.join([str(x) for x in mapping(centroid)['coordinates']])
 
+def get_sliver_mask(geoms, threshold):
+    type_ids = shapely.get_type_id(geoms)
+
+    polygons = np.isin(type_ids, [constants.GEOM_TYPES.index(x) for x in ['Polygon', 'MultiPolygon']])
+    lines = np.isin(type_ids, [constants.GEOM_TYPES.index(x) for x in ['LineString', 'MultiLineString']])
+
+    # a part is either polygonal or linear, so one buffer holds its area or its length
+    measures = np.full(geoms.shape, np.nan)
+
+    # ragged arrays hold a single geometry type, which exploded parts always are
+    multiparts = np.isin(type_ids, [constants.GEOM_TYPES.index(x) for x in ['MultiPolygon', 'MultiLineString']])
+
+    kernels = get_kernels()
+
+    if kernels is not None and not multiparts.any():
+        if polygons.any():
+            _, coords, (rings, parts) = shapely.to_ragged_array(geoms[polygons])
+            measures[polygons] = kernels.polygon_areas(coords, rings, parts)
+        if lines.any():
+            _, coords, (parts,) = shapely.to_ragged_array(geoms[lines])
+            measures[lines] = kernels.line_lengths(coords, parts)
+    else:
+        measures[polygons] = shapely.area(geoms[polygons])
+        measures[lines] = shapely.length(geoms[lines])
+
+    # NaN marks everything that is not measured, which is never below the threshold
+    with np.errstate(invalid='ignore'):
+        return np.less(measures, threshold)
+
 def get_type(series):
+    # eg. duplicated column names select a frame rather than a series
+    if getattr(series, 'ndim', 1) != 1:
+        return constants.TYPE_UNSUPPORTED
+
     if series.name == 'geometry' and isinstance(series, gpd.GeoSeries):
         return constants.TYPE_GEO
 
+    if series.size and not series.count():
+        return constants.TYPE_EMPTY
+
+    dtype = get_dtype_type(series.dtype)
+    if dtype is not None:
+        return dtype
+
     try:
-        distinct_count = series.nunique()
-        value_count = series.nunique(dropna=False)
-
-        if value_count == 1 and distinct_count == 0:
-            return constants.TYPE_EMPTY
-        elif pd_types.is_bool_dtype(series):
-            return constants.TYPE_BOOL
-        elif pd_types.is_datetime64_dtype(series):
-            return constants.TYPE_DATE
-        elif pd_types.is_numeric_dtype(series):
-            return constants.TYPE_NUM
-        else:
-            return constants.TYPE_STR
-    except:
-        # eg. 2D series
+        # hashing the values is the only way to find columns holding eg. lists or dicts
+        get_distinct_count(series)
+    except TypeError:
         return constants.TYPE_UNSUPPORTED
 
-def is_outbound(x, lower, upper):
-    if lower and x < lower:
-        return 'Value is less than the lower bound'
-    elif upper and x > upper:
-        return 'Value is greater than the upper bound'
-    else:
-        return None
+    return constants.TYPE_STR
+
+def get_outbounds(df, bounds):
+    outbounds = {}
+
+    for col, bound in bounds.items():
+        assert len(bound) == 2, 'A lower and upper bound must be provided, use np.nan if no bounds'
+
+        lower, upper = bound
+        values = df[col]
+
+        below = np.zeros(len(values), dtype=bool)
+        above = np.zeros(len(values), dtype=bool)
+
+        # compared against the scalar bounds, missing values (NaN or NA) compare as False
+        with np.errstate(invalid='ignore'):
+            if not pd.isnull(lower):
+                below = (values < lower).to_numpy(dtype=bool, na_value=False)
+            if not pd.isnull(upper):
+                above = (values > upper).to_numpy(dtype=bool, na_value=False)
+
+        outside = below | above
+
+        if outside.any():
+            outbounds[col] = pd.Series(
+                np.where(below[outside], 'Value is less than the lower bound', 'Value is greater than the upper bound'),
+                index=values.index[outside]
+            )
+
+    return outbounds
 
 def is_sliver(x, threshold):
     if 'polygon' in x.geom_type.lower():
@@ -121,9 +337,9 @@ def key_exists(content, *keys):
     _values = content
 
     for k in keys:
-        try:
-            _values = _values[k]
-        except KeyError:
+        if not isinstance(_values, dict) or k not in _values:
             return False
 
+        _values = _values[k]
+
     return True
@@ -1,5 +1,8 @@
 from shapely.validation import explain_validity
 
+import shapely
+
+import numpy as np
 import pandas as pd
 
 import petk.constants as constants
@@ -13,10 +16,47 @@ def bounding_box(series, bounding_box):
 
     assert xmin < xmax and ymin < ymax, 'Invalid bounding box given'
 
-    outsiders = series.loc[~series.index.isin(series.cx[xmin:xmax, ymin:ymax].index)]
+    bbox = shapely.geometry.box(xmin, ymin, xmax, ymax)
+    message = 'Geometry outside of bbox({0}, {1}, {2}, {3})'.format(xmin, xmax, ymin, ymax)
+
+    # when the whole layer lies on one side of the box edges every geometry is settled at once
+    total = series.total_bounds
+    if total[2] < xmin or total[0] > xmax or total[3] < ymin or total[1] > ymax:
+        return pd.Series(message, index=series.index)
+    elif total[0] >= xmin and total[2] <= xmax and total[1] >= ymin and total[3] <= ymax:
+        # missing and empty geometries carry no bounds and never intersect the box
+        if not (series.isna() | series.is_empty).any():
+            return None
+
+    if getattr(series, 'has_sindex', False):
+        # a spatial index built earlier answers the query without scanning every geometry
+        outside = np.ones(len(series), dtype=bool)
+        outside[series.sindex.query(bbox, predicate='intersects')] = False
+    else:
+        if tools.SHAPELY_VECTORIZED:
+            geoms = np.asarray(series.values)
+            bounds = shapely.bounds(geoms)
+        else:
+            bounds = series.bounds.to_numpy()
+
+        disjoint = (bounds[:, 2] < xmin) | (bounds[:, 0] > xmax) | (bounds[:, 3] < ymin) | (bounds[:, 1] > ymax)
+        within = (bounds[:, 0] >= xmin) & (bounds[:, 2] <= xmax) & (bounds[:, 1] >= ymin) & (bounds[:, 3] <= ymax)
+
+        # only geometries whose bounds straddle the box edge (or are missing) need an exact intersection test
+        outside = disjoint
+        straddling = ~(disjoint | within)
+
+        if tools.SHAPELY_VECTORIZED:
+            # the box is tested against every straddling geometry, preparing it builds its GEOS index once
+            shapely.prepare(bbox)
+            outside[straddling] = ~shapely.intersects(bbox, geoms[straddling])
+        else:
+            outside[straddling] = ~series[straddling].intersects(bbox).to_numpy()
+
+    outsiders = series[outside]
 
     if not outsiders.empty:
-        return outsiders.apply(lambda x: 'Geometry outside of bbox({0}, {1}, {2}, {3})'.format(xmin, xmax, ymin, ymax))
+        return pd.Series(message, index=outsiders.index)
 
 # def content_type(series, expected):
     # dtypes = series.apply(lambda x: tools.get_type(pd.Series([x], name=series.name)))
@@ -28,33 +68,55 @@ def bounding_box(series, bounding_box):
     #     return invalids.apply(lambda x: 'Expected type {0} found type {1}'.format(expected, x))
 
 def geospatial(series):
+    if tools.SHAPELY_VECTORIZED:
+        geoms = np.asarray(series.values)
+        invalid = ~shapely.is_valid(geoms)
+
+        if invalid.any():
+            geoms = geoms[invalid]
+            reasons = np.where(shapely.is_missing(geoms), 'Null geometry', shapely.is_valid_reason(geoms))
+
+            return pd.Series(reasons, index=series.index[invalid])
+
+        return None
+
     invalids = series[~series.is_valid]
 
     if not invalids.empty:
         return invalids.apply(lambda x: explain_validity(x) if not x is None else 'Null geometry')
 
 def range(series, bounds):
-    assert len(bounds) == 2, 'A lower and upper bound must be provided, use np.nan if no bounds'
-
-    lower, upper = bounds
-
-    outbounds = series.apply(tools.is_outbound, args=[lower, upper])
-    outbounds = outbounds[~outbounds.isnull()]
-
-    if not outbounds.empty:
-        return outbounds
+    # same comparison DataReport.validate runs for every range column at once
+    return tools.get_outbounds(series.to_frame(name='values'), {'values': bounds}).get('values')
 
 def accepted(series, values):
-    outbounds = series[~series.isin(values)]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # only the categories need a lookup, missing values (code -1) take the last entry
+        allowed = np.append(series.cat.categories.isin(values), pd.isnull(list(values)).any())
+        outbounds = series[~allowed[series.cat.codes.to_numpy()]]
+    else:
+        outbounds = series[~series.isin(values)]
 
     if not outbounds.empty:
-        return outbounds.apply(lambda x: 'Value not within the accepted range')
+        return pd.Series('Value not within the accepted range', index=outbounds.index)
 
 def sliver(series, params):
-    pieces = series.explode().to_crs({'init': 'epsg:{0}'.format(params['projected_coordinates']), 'units': 'm'})
+    crs = tools.get_crs(params['projected_coordinates'])
+
+    # data already in the projection would only have every vertex transformed onto itself
+    if series.crs != crs:
+        series = series.to_crs(crs)
+
+    if tools.SHAPELY_VECTORIZED:
+        # parts are taken straight from the geometry array, without exploding into a new GeoSeries
+        parts, origins = shapely.get_parts(np.asarray(series.values), return_index=True)
+        counts = np.bincount(origins[tools.get_sliver_mask(parts, params['threshold'])], minlength=len(series))
 
-    slivers = pieces.apply(tools.is_sliver, args=[params['threshold']])
-    slivers = slivers[slivers].groupby(level=0).count()
+        slivers = pd.Series(counts, index=series.index)
+        slivers = slivers[slivers > 0]
+    else:
+        slivers = series.explode().apply(tools.is_sliver, args=[params['threshold']])
+        slivers = slivers[slivers].groupby(level=0).count()
 
     if not slivers.empty:
-        return slivers.apply(lambda x: '{0} slivers found within geometry'.format(x))
+        return slivers.astype(str) + ' slivers found within geometry'